@@ -1,144 +1,42 @@
 #!/usr/bin/env python3
 
 import argparse
-from concurrent.futures import ThreadPoolExecutor
-import glob
-import json
+import asyncio
+import functools
+import itertools
 import os
-import subprocess
-import tempfile
 
-from deepgram import DeepgramClient, PrerecordedOptions, FileSource
 from dotenv import load_dotenv
-import httpx
-
-
-def extract_audio_from_video(video_path, audio_path):
-    """Extract audio from video file using FFmpeg"""
-    cmd = [
-        "ffmpeg",
-        "-i",
-        video_path,
-        "-vn",
-        "-q:a",
-        "0",
-        "-map",
-        "a",
-        audio_path,
-        "-y",  # -y to overwrite without asking
-    ]
-
-    try:
-        subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"Error extracting audio: {e.stderr}")
-        return False
-    except FileNotFoundError:
-        print(
-            "Error: FFmpeg not found. Please install FFmpeg to use video processing."
-        )
-        return False
-
-
-def process_audio_file(file_path, args, api_key):
-    """Process a single audio file or video file"""
-    temp_audio_path = None
-    video_extensions = (".mp4", ".webm", ".mkv")
-    is_video = file_path.lower().endswith(video_extensions)
-
-    try:
-        # Step 1: Handle video files by extracting audio
-        if is_video:
-            print(f"\nProcessing video file: {file_path}")
-
-            # Create temporary audio file
-            temp_fd, temp_audio_path = tempfile.mkstemp(suffix=".mp3")
-            os.close(temp_fd)  # Close the file descriptor
-
-            print(f"Extracting audio from {file_path}...")
-            if not extract_audio_from_video(file_path, temp_audio_path):
-                return
-
-            audio_file_path = temp_audio_path
-            print("Audio extracted to temporary file.")
-        else:
-            audio_file_path = file_path
 
-        # Step 2: Process audio with Deepgram
-        deepgram = DeepgramClient(api_key=api_key)
+from dg_transcribe import (
+    DEFAULT_JOBS,
+    EMBED_SUFFIX,
+    VIDEO_EXTENSIONS,
+    create_deepgram_client,
+    process_audio_file_async,
+)
 
-        with open(audio_file_path, "rb") as audio:
-            buffer_data = audio.read()
+AUDIO_EXTENSIONS = (".mp3",)
 
-        print("Sending request to Deepgram for transcription...")
 
-        # Create payload with audio buffer (v4.8.1 API)
-        payload: FileSource = {
-            "buffer": buffer_data,
-        }
+@functools.cache
+def _get_api_key():
+    """Load .env (once per process) and return the Deepgram API key"""
+    load_dotenv()
+    return os.getenv("DEEPGRAM_API_KEY")
 
-        # Create options object (v4.8.1 API)
-        options = PrerecordedOptions(
-            model=args.model,
-            language=args.language,
-            smart_format=True,
-            utterances=True,
-            punctuate=True,
-            diarize=args.diarize,
-        )
 
-        # Call transcribe_file with v4.8.1 API
-        # Set timeout to 5 minutes for large files
-        timeout_config = httpx.Timeout(300.0, connect=10.0)
-        response = deepgram.listen.rest.v("1").transcribe_file(
-            payload, options, timeout=timeout_config
-        )
+async def _worker(files, total, completed, args, client):
+    """Transcribe files from a shared iterator until it is exhausted"""
+    # Each worker pulls the next file only when it is free, so there is
+    # one task per worker rather than per file
+    for file_path in files:
+        await process_audio_file_async(file_path, args, client)
+        print(f"Progress: {next(completed)}/{total} files done")
 
-        print("Received response from Deepgram.")
 
-        if args.transcript:
-            print(f"\nTranscript for {file_path}:")
-            print(
-                response["results"]["channels"][0]["alternatives"][0][
-                    "transcript"
-                ]
-            )
-        else:
-            print("Generating subtitles...")
-            from deepgram_captions import DeepgramConverter, srt
-
-            # v4.8.1 response is already a dict, use directly
-            converter = DeepgramConverter(response)
-            srt_captions = srt(converter)
-
-            input_dir = os.path.dirname(file_path)
-            base_filename_no_ext = os.path.splitext(
-                os.path.basename(file_path)
-            )[0]
-
-            # Save SRT file for both audio and video files
-            srt_filename = os.path.join(
-                input_dir, f"{base_filename_no_ext}.srt"
-            )
-            with open(srt_filename, "w") as f:
-                f.write(srt_captions)
-            print(f"SRT subtitles saved to: {srt_filename}")
-
-    except Exception as e:
-        print(f"An error occurred processing {file_path}: {e}")
-    finally:
-        # Cleanup temporary audio file
-        if temp_audio_path and os.path.exists(temp_audio_path):
-            try:
-                os.remove(temp_audio_path)
-            except OSError:
-                pass
-
-
-def main():
-    load_dotenv()
-    api_key = os.getenv("DEEPGRAM_API_KEY")
+async def main():
+    api_key = _get_api_key()
 
     if not api_key:
         print(
@@ -181,7 +79,9 @@ def main():
         "-t",
         "--transcript",
         action="store_true",
-        help="Generate transcript only (no subtitles)",
+        help="Generate transcript only (no subtitles). Skips smart "
+        "formatting, punctuation and utterances for a faster response, "
+        "so the text is raw and unpunctuated",
     )
     parser.add_argument(
         "-d",
@@ -189,8 +89,36 @@ def main():
         action="store_true",
         help="Enable speaker diarization (identify different speakers)",
     )
+    parser.add_argument(
+        "-e",
+        "--embed",
+        action="store_true",
+        help=f"Also write <name>{EMBED_SUFFIX}.<ext> next to each video with "
+        "the subtitles muxed in (streams are copied, not re-encoded)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help="Number of files to transcribe concurrently when processing "
+        f"a directory [default: {DEFAULT_JOBS}]",
+    )
+    parser.add_argument(
+        "-s",
+        "--downsample",
+        action="store_true",
+        help="Downmix to 16 kHz mono Opus with FFmpeg before uploading "
+        "(smaller uploads, costs a local encode)",
+    )
 
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.embed and not args.video:
+        parser.error("--embed only applies to videos and needs -v")
+    if args.embed and args.transcript:
+        parser.error("--embed needs subtitles and can't be used with -t")
 
     print(f"Model: {args.model}")
     print(f"Language: {args.language}")
@@ -198,58 +126,66 @@ def main():
     # Determine the file path and extension based on which option was used
     if args.file:
         file_path = args.file
-        file_extension = "*.mp3"
+        extensions = AUDIO_EXTENSIONS
         file_type = "MP3"
     else:  # args.video
         file_path = args.video
-        file_extension = ["*.mp4", "*.webm", "*.mkv"]
+        extensions = VIDEO_EXTENSIONS
         file_type = "video"
 
     print(f"File/Directory: {file_path}")
     print(f"Transcript only: {args.transcript}")
     print(f"Speaker diarization: {args.diarize}")
-
-    # Check if the path is a directory or a file
-    if os.path.isdir(file_path):
-        # Find all files with the appropriate extension in the directory
-        media_files = []
-        if isinstance(file_extension, list):
-            for ext in file_extension:
-                media_files.extend(glob.glob(os.path.join(file_path, ext)))
-        else:
-            media_files = glob.glob(os.path.join(file_path, file_extension))
-        if not media_files:
-            print(f"No {file_type} files found in directory: {file_path}")
-            return
-
-        print(f"Found {len(media_files)} {file_type} files to process")
-
-        # Process files in batches of 5
-        batch_size = 5
-        for i in range(0, len(media_files), batch_size):
-            batch = media_files[i : i + batch_size]
-            print(
-                f"\nProcessing batch {i // batch_size + 1} ({len(batch)} files)"
-            )
-
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                futures = [
-                    executor.submit(
-                        process_audio_file, file_path, args, api_key
+    print(f"Embed subtitles: {args.embed}")
+    print(f"Downsample: {args.downsample}")
+
+    # Reuse one connection pool (and its TLS sessions) for every file
+    async with create_deepgram_client(api_key, args.jobs) as client:
+        # Check if the path is a directory or a file
+        if os.path.isdir(file_path):
+            # Find all files with the appropriate extension in one pass
+            # over the directory. Like glob, skip dotfiles (e.g. macOS
+            # AppleDouble "._clip.mp4" files); also skip subtitled copies
+            # written by earlier --embed runs
+            with os.scandir(file_path) as it:
+                entries = [
+                    entry
+                    for entry in it
+                    if not entry.name.startswith(".")
+                    and entry.is_file()
+                    and os.path.splitext(entry.name)[1].lower() in extensions
+                    and not os.path.splitext(entry.name)[0].endswith(
+                        EMBED_SUFFIX
                     )
-                    for file_path in batch
                 ]
+            # Start the largest files first (longest-processing-time-first)
+            # so short jobs fill in around them instead of trailing at the end
+            entries.sort(key=lambda entry: entry.stat().st_size, reverse=True)
+            media_files = [entry.path for entry in entries]
+            if not media_files:
+                print(f"No {file_type} files found in directory: {file_path}")
+                return
 
-                # Wait for all tasks in this batch to complete
-                for future in futures:
-                    future.result()
+            print(f"Found {len(media_files)} {file_type} files to process")
+
+            # Keep a rolling window of requests in flight instead of waiting
+            # on the slowest file of each batch. Workers take files in
+            # sorted order, so the largest are still started first.
+            files = iter(media_files)
+            completed = itertools.count(1)
+            await asyncio.gather(
+                *[
+                    _worker(files, len(media_files), completed, args, client)
+                    for _ in range(min(args.jobs, len(media_files)))
+                ]
+            )
 
-    elif os.path.isfile(file_path):
-        # Process single file
-        process_audio_file(file_path, args, api_key)
-    else:
-        print(f"Error: {file_path} is not a valid file or directory")
+        elif os.path.isfile(file_path):
+            # Process single file
+            await process_audio_file_async(file_path, args, client)
+        else:
+            print(f"Error: {file_path} is not a valid file or directory")
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -0,0 +1,238 @@
+"""FFmpeg helpers: stream a file's audio to stdout and embed subtitles"""
+
+import asyncio
+import collections
+import os
+
+CHUNK_SIZE = 1 << 20  # 1 MiB reads from FFmpeg's stdout
+FFMPEG_STDERR_TAIL = 200  # lines of FFmpeg output kept for error messages
+
+# Subtitle codec each container can hold, used when embedding
+SUBTITLE_CODECS = {".mp4": "mov_text", ".mkv": "srt", ".webm": "webvtt"}
+
+# Containers tag tracks with 3-letter ISO 639-2 codes, so map Deepgram's
+# ISO 639-1 codes (the part before any region, e.g. "en" in "en-US").
+# Matroska/WebM use the bibliographic (/B) codes below...
+ISO_639_2_B_CODES = {
+    "bg": "bul", "ca": "cat", "cs": "cze", "da": "dan", "de": "ger",
+    "el": "gre", "en": "eng", "es": "spa", "et": "est", "fi": "fin",
+    "fr": "fre", "hi": "hin", "hu": "hun", "id": "ind", "it": "ita",
+    "ja": "jpn", "ko": "kor", "lt": "lit", "lv": "lav", "ms": "may",
+    "nl": "dut", "no": "nor", "pl": "pol", "pt": "por", "ro": "rum",
+    "ru": "rus", "sk": "slo", "sv": "swe", "ta": "tam", "th": "tha",
+    "tr": "tur", "uk": "ukr", "vi": "vie", "zh": "chi",
+}  # fmt: skip
+# ...while the MP4 mdhd language field uses the terminology (/T) codes,
+# which differ from /B for these languages
+ISO_639_2_T_CODES = {
+    "cs": "ces", "de": "deu", "el": "ell", "fr": "fra", "ms": "msa",
+    "nl": "nld", "ro": "ron", "sk": "slk", "zh": "zho",
+}  # fmt: skip
+
+# Demux the original audio track without re-encoding it (AAC -> ADTS)
+AUDIO_COPY_ARGS = ["-map", "a:0", "-c:a", "copy", "-f", "adts"]
+# How FFmpeg reports a non-AAC track being copied into ADTS (older
+# releases, then FFmpeg 6+); only then is the re-encode fallback worth it
+ADTS_CODEC_ERRORS = (
+    "Only AAC streams can be muxed by the ADTS muxer",
+    "adts muxer supports only codec aac",
+)
+# Fallback for tracks that can't be muxed as ADTS (e.g. Opus/Vorbis in WebM)
+AUDIO_ENCODE_ARGS = [
+    "-map",
+    "a:0",
+    "-c:a",
+    "libopus",
+    "-b:a",
+    "32k",
+    "-f",
+    "ogg",
+]
+# Optional 16 kHz mono Opus, which is all the speech models need
+AUDIO_DOWNSAMPLE_ARGS = [
+    "-map",
+    "a:0",
+    "-ac",
+    "1",
+    "-ar",
+    "16000",
+    "-c:a",
+    "libopus",
+    "-b:a",
+    "24k",
+    "-f",
+    "ogg",
+]
+
+
+async def _drain_lines(stream, lines):
+    """Read a pipe to EOF as it fills, keeping only its last lines"""
+    async for line in stream:
+        lines.append(line.decode(errors="replace").rstrip())
+
+
+async def _ffmpeg_stdout(cmd, chunk_size):
+    """Run FFmpeg and yield its stdout in chunks as it is written"""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=chunk_size,
+    )
+    # Drain stderr concurrently so a chatty FFmpeg can't block on a full
+    # pipe, and memory stays bounded however long it runs
+    stderr_tail = collections.deque(maxlen=FFMPEG_STDERR_TAIL)
+    drain = asyncio.create_task(_drain_lines(proc.stderr, stderr_tail))
+
+    try:
+        while True:
+            chunk = await proc.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+        await proc.wait()
+        await drain
+        if proc.returncode != 0:
+            raise RuntimeError(
+                "Error extracting audio: " + "\n".join(stderr_tail)
+            )
+    finally:
+        # Don't leave FFmpeg running if the upload was aborted
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        drain.cancel()
+
+
+def _audio_extract_cmd(input_path, codec_args):
+    """Build the FFmpeg command that writes a file's audio to stdout"""
+    return [
+        "ffmpeg",
+        "-nostdin",
+        "-nostats",
+        "-loglevel",
+        "error",
+        "-i",
+        input_path,
+        "-vn",
+        *codec_args,
+        "-",  # write to stdout
+    ]
+
+
+async def extract_audio_from_video(video_path, chunk_size=CHUNK_SIZE):
+    """Extract audio from video file using FFmpeg, yielding it as demuxed"""
+    try:
+        stream = _ffmpeg_stdout(
+            _audio_extract_cmd(video_path, AUDIO_COPY_ARGS), chunk_size
+        )
+        try:
+            first_chunk = await stream.__anext__()
+        except StopAsyncIteration:
+            return
+        except RuntimeError as e:
+            # Copying fails up front, before any output, when the track
+            # isn't AAC, so it is safe to start over with a re-encode. Any
+            # other failure (no audio, unreadable file) would fail again.
+            if not any(marker in str(e) for marker in ADTS_CODEC_ERRORS):
+                raise
+            print(f"Re-encoding audio from {video_path} to Opus...")
+            stream = _ffmpeg_stdout(
+                _audio_extract_cmd(video_path, AUDIO_ENCODE_ARGS), chunk_size
+            )
+        else:
+            yield first_chunk
+
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+    except FileNotFoundError:
+        raise RuntimeError(
+            "FFmpeg not found. Please install FFmpeg to use video processing."
+        )
+
+
+async def downsample_audio(input_path, chunk_size=CHUNK_SIZE):
+    """Downmix and resample audio/video to 16 kHz mono Opus using FFmpeg"""
+    stream = _ffmpeg_stdout(
+        _audio_extract_cmd(input_path, AUDIO_DOWNSAMPLE_ARGS), chunk_size
+    )
+    try:
+        async for chunk in stream:
+            yield chunk
+    except FileNotFoundError:
+        raise RuntimeError(
+            "FFmpeg not found. Please install FFmpeg to use --downsample."
+        )
+    finally:
+        await stream.aclose()
+
+
+async def embed_subtitles_in_video(
+    video_path, srt_path, output_path, language
+):
+    """Mux an SRT file into a copy of the video without re-encoding"""
+    ext = os.path.splitext(video_path)[1].lower()
+    primary_language = language.split("-")[0].lower()
+    language_tag = ISO_639_2_B_CODES.get(primary_language, primary_language)
+    if ext == ".mp4":
+        language_tag = ISO_639_2_T_CODES.get(primary_language, language_tag)
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-nostats",
+        "-loglevel",
+        "error",
+        "-i",
+        video_path,
+        "-i",
+        srt_path,
+        # Put the new track first among the subtitles so the s:0 specifiers
+        # below refer to it; existing subtitle tracks follow unchanged
+        "-map",
+        "0:v?",
+        "-map",
+        "0:a?",
+        "-map",
+        "1:0",
+        "-map",
+        "0:s?",
+    ]
+    if ext == ".mkv":
+        # Only Matroska can hold arbitrary copied data streams and
+        # attachments (e.g. fonts for ASS tracks). MP4 rejects camera data
+        # tracks like tmcd/gpmd and WebM allows only a few codecs, so
+        # mapping them there would make the whole remux fail.
+        cmd += ["-map", "0:d?", "-map", "0:t?"]
+    cmd += [
+        "-c",
+        "copy",
+        "-c:s:0",
+        SUBTITLE_CODECS[ext],
+        "-metadata:s:s:0",
+        f"language={language_tag}",
+        output_path,
+        "-y",  # -y to overwrite without asking
+    ]
+
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise RuntimeError(
+            "FFmpeg not found. Please install FFmpeg to use --embed."
+        )
+
+    stderr_tail = collections.deque(maxlen=FFMPEG_STDERR_TAIL)
+    await _drain_lines(proc.stderr, stderr_tail)
+    await proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError(
+            "Error embedding subtitles: " + "\n".join(stderr_tail)
+        )
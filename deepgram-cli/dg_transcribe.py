@@ -0,0 +1,163 @@
+"""Deepgram transcription of a single audio or video file"""
+
+import asyncio
+import os
+
+from deepgram import PrerecordedOptions
+from deepgram_captions import DeepgramConverter, srt
+import httpx
+
+from dg_ffmpeg import (
+    CHUNK_SIZE,
+    downsample_audio,
+    embed_subtitles_in_video,
+    extract_audio_from_video,
+)
+
+DEEPGRAM_LISTEN_URL = "https://api.deepgram.com/v1/listen"
+DEFAULT_JOBS = 16
+VIDEO_EXTENSIONS = (".mp4", ".webm", ".mkv")
+EMBED_SUFFIX = ".subbed"  # <name>.subbed.mp4 is written next to <name>.mp4
+
+
+async def iter_file_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yield a file's contents in chunks without loading it all into memory"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def create_deepgram_client(api_key, max_connections=DEFAULT_JOBS):
+    """Create one HTTP client whose connection pool is shared by all uploads"""
+    return httpx.AsyncClient(
+        # Concurrent uploads multiplex over shared HTTP/2 connections
+        http2=True,
+        headers={"Authorization": f"Token {api_key}"},
+        # Set timeout to 5 minutes for large files
+        timeout=httpx.Timeout(300.0, connect=10.0),
+        # Under HTTP/2 httpx multiplexes every upload as a stream over one
+        # connection to api.deepgram.com (sharing its congestion window),
+        # so these limits only cap sockets if the server falls back to
+        # HTTP/1.1. Sizing them to --jobs keeps uploads off the pool queue.
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+    )
+
+
+async def transcribe_stream(client, chunks, options):
+    """Upload audio chunks to Deepgram's pre-recorded endpoint"""
+    # Query params follow the SDK's encoding: booleans as "true"/"false"
+    params = {
+        key: str(value).lower() if isinstance(value, bool) else value
+        for key, value in options.to_dict().items()
+    }
+
+    try:
+        response = await client.post(
+            DEEPGRAM_LISTEN_URL, params=params, content=chunks
+        )
+    except httpx.HTTPError as e:
+        # Transport errors (e.g. the server closing the connection
+        # mid-upload) often have an empty message, so name the type and URL
+        detail = f": {e}" if str(e) else ""
+        raise RuntimeError(
+            f"{type(e).__name__} while uploading to {DEEPGRAM_LISTEN_URL}"
+            f"{detail}"
+        ) from e
+    if not response.is_success:
+        # Surface Deepgram's own explanation (bad key, unsupported audio...)
+        try:
+            detail = response.json().get("err_msg") or response.text
+        except ValueError:
+            detail = response.text
+        raise RuntimeError(
+            f"Deepgram returned {response.status_code}: {detail}"
+        )
+    return response.json()
+
+
+async def process_audio_file_async(file_path, args, client):
+    """Process a single audio file or video file"""
+    is_video = file_path.lower().endswith(VIDEO_EXTENSIONS)
+
+    try:
+        # Step 1: Pick the audio source. Video audio is piped straight from
+        # FFmpeg into the upload, without an intermediate file.
+        if is_video:
+            print(f"\nProcessing video file: {file_path}")
+            print(f"Streaming audio from {file_path}...")
+
+        if args.downsample:
+            audio_chunks = downsample_audio(file_path)
+        elif is_video:
+            audio_chunks = extract_audio_from_video(file_path)
+        else:
+            audio_chunks = iter_file_chunks(file_path)
+
+        # Step 2: Process audio with Deepgram
+        print("Sending request to Deepgram for transcription...")
+
+        # Create options object (v4.8.1 API). Subtitles need utterances and
+        # formatted text; a plain transcript skips that server-side work.
+        opts = {
+            "model": args.model,
+            "language": args.language,
+            "diarize": args.diarize,
+        }
+        if not args.transcript:
+            opts.update(smart_format=True, utterances=True, punctuate=True)
+        options = PrerecordedOptions(**opts)
+
+        # Stream the body so memory stays flat regardless of file size
+        response = await transcribe_stream(client, audio_chunks, options)
+
+        print("Received response from Deepgram.")
+
+        # Transcript mode only needs the response text: nothing below
+        # (SRT writing, embedding) applies, so stop here
+        if args.transcript:
+            print(f"\nTranscript for {file_path}:")
+            print(
+                response["results"]["channels"][0]["alternatives"][0][
+                    "transcript"
+                ]
+            )
+            return
+
+        print("Generating subtitles...")
+
+        # The REST response is already a dict, use directly
+        converter = DeepgramConverter(response)
+        srt_captions = srt(converter)
+
+        input_dir = os.path.dirname(file_path)
+        base_filename_no_ext = os.path.splitext(os.path.basename(file_path))[0]
+
+        # Save SRT file for both audio and video files
+        srt_filename = os.path.join(input_dir, f"{base_filename_no_ext}.srt")
+        # Write UTF-8 explicitly (not the platform default encoding)
+        # in a single buffered write
+        data = srt_captions.encode("utf-8")
+        with open(srt_filename, "wb", buffering=1 << 20) as f:
+            f.write(data)
+        print(f"SRT subtitles saved to: {srt_filename}")
+
+        if args.embed and is_video:
+            # Write a subtitled copy; the original is left untouched
+            ext = os.path.splitext(file_path)[1]
+            embedded_filename = os.path.join(
+                input_dir, f"{base_filename_no_ext}{EMBED_SUFFIX}{ext}"
+            )
+            print("Embedding subtitles...")
+            await embed_subtitles_in_video(
+                file_path, srt_filename, embedded_filename, args.language
+            )
+            print(f"Subtitled video saved to: {embedded_filename}")
+
+    except Exception as e:
+        print(f"An error occurred processing {file_path}: {e}")